@@ -6,10 +6,12 @@ __all__ = [
     "BlindFileLoader",
     "SpecificFileLoader",
     "ChromaCollection",
-    "Splitter"
+    "Splitter",
+    "ingest"
 ]
 
 from .embeddings import EmbeddingFromHF
 from .doc_loader import MultiFileLoader, BlindFileLoader, SpecificFileLoader
 from .vector_db import ChromaCollection
-from .doc_splitter import Splitter
\ No newline at end of file
+from .doc_splitter import Splitter
+from .ingest import ingest
\ No newline at end of file
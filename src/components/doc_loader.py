@@ -8,7 +8,9 @@ License(GPL)
 Author: Kai
 """
 import os
-from typing import Literal, Optional, Callable, List, Dict, Any
+from functools import partial
+from multiprocessing import Pool
+from typing import Literal, Optional, Callable, List, Dict, Any, Iterator, Set
 from langchain_core.documents import Document
 from langchain_unstructured import UnstructuredLoader
 from langchain_community.document_loaders import (
@@ -17,6 +19,8 @@ from langchain_community.document_loaders import (
     JSONLoader, 
     PyPDFLoader, 
     PDFMinerLoader,
+    PyMuPDFLoader,
+    PyPDFium2Loader,
     UnstructuredExcelLoader,
     UnstructuredMarkdownLoader,
     UnstructuredWordDocumentLoader
@@ -24,6 +28,77 @@ from langchain_community.document_loaders import (
 from langchain_community.document_loaders.parsers.images import LLMImageBlobParser
 from langchain_openai import ChatOpenAI
 
+def _safe_load(
+    loader: Callable[[str], Optional[List[Document]]],
+    file_path: str
+    ) -> Optional[List[Document]]:
+    """调用加载函数加载单个文件, 出错时打印错误并返回None.
+    
+    定义在模块层级, 以便在子进程中使用.
+    """
+    try:
+        return loader(file_path)
+    except Exception as e:
+        print(f"加载文件 {file_path} 时出错: {str(e)}")
+        return None
+
+def _scan_dir(
+    dir_path: str,
+    exts: Optional[Set[str]] = None
+    ) -> List[str]:
+    """列出目录下的文件路径, 不包含子目录.
+    
+    利用os.scandir一次遍历, 文件类型信息由目录项缓存, 无需逐个stat.
+    
+    Args:
+        dir_path (str): 目录路径.
+        exts (Optional[Set[str]]): 小写的扩展名集合, 如{".pdf"}, 为None时不过滤.
+    
+    Returns:
+        List[str]: 文件路径列表.
+    """
+    with os.scandir(dir_path) as entries:
+        return [
+            entry.path for entry in entries
+            if entry.is_file()
+            and (exts is None or os.path.splitext(entry.name)[1].lower() in exts)
+        ]
+
+def _load_processes(
+    env_key: str
+    ) -> int:
+    """读取环境变量env_key指定的进程数, 默认为1, 即在当前进程中加载."""
+    return int(os.environ.get(env_key, 1))
+
+def _map_files(
+    loader: Callable[[str], Optional[List[Document]]],
+    file_paths: List[str],
+    env_key: str
+    ) -> Iterator[Optional[List[Document]]]:
+    """利用进程池并行加载多个文件.
+    
+    进程数由环境变量env_key指定, 默认为1.
+    进程数为1或只有一个文件时直接在当前进程中加载.
+    启用进程池时, 调用方脚本必须放在 if __name__ == "__main__": 之下,
+    且应在初始化CUDA或创建Chroma客户端之前完成加载.
+    并行加载时loader及其参数必须可以被pickle.
+    
+    Args:
+        loader (Callable[[str], Optional[List[Document]]]): 单个文件加载函数.
+        file_paths (List[str]): 文件路径列表.
+        env_key (str): 指定进程数的环境变量名.
+    
+    Returns:
+        Iterator[Optional[List[Document]]]: 按file_paths顺序返回的加载结果.
+    """
+    worker = partial(_safe_load, loader)
+    processes = _load_processes(env_key)
+    if processes <= 1 or len(file_paths) <= 1:
+        yield from map(worker, file_paths)
+        return
+    with Pool(min(processes, len(file_paths))) as pool:
+        yield from pool.imap(worker, file_paths, chunksize=1)
+
 class MultiFileLoader:
     """多文件加载器.
     
@@ -173,6 +248,19 @@ class MultiFileLoader:
         loader = UnstructuredMarkdownLoader(file_path=file_path, mode=mode)
         return loader.load()
 
+# 扩展名到加载函数的映射, 参数依次为文件路径、编码、加载模式、PDF密码
+_EXT_DISPATCH = {
+    '.txt': lambda p, e, m, pw: MultiFileLoader.load_text_file(p, encoding=e),
+    '.csv': lambda p, e, m, pw: MultiFileLoader.load_csv_file(p),
+    '.json': lambda p, e, m, pw: MultiFileLoader.load_json_file(p),
+    '.pdf': lambda p, e, m, pw: MultiFileLoader.load_pdf_file(p, password=pw),
+    '.docx': lambda p, e, m, pw: MultiFileLoader.load_docx_file(p, mode=m),
+    '.xlsx': lambda p, e, m, pw: MultiFileLoader.load_excel_file(p, mode=m),
+    '.xls': lambda p, e, m, pw: MultiFileLoader.load_excel_file(p, mode=m),
+    '.md': lambda p, e, m, pw: MultiFileLoader.load_markdown_file(p, mode=m),
+    '.markdown': lambda p, e, m, pw: MultiFileLoader.load_markdown_file(p, mode=m),
+}
+
 class BlindFileLoader:
     """盲文件加载器.
     
@@ -219,10 +307,8 @@ class BlindFileLoader:
         Returns:
             List[Document]: 文档列表.
         """ 
-        files = os.listdir(dir_path)
         docs = []
-        for file in files:
-            file_path = os.path.join(dir_path, file)
+        for file_path in _scan_dir(dir_path):
             try:
                 temp = BlindFileLoader.load_any_file(file_path, key=key)
                 if temp:
@@ -254,23 +340,11 @@ class BlindFileLoader:
         ext = os.path.splitext(file_path.lower())[1]
         
         try:
-            if ext == '.txt':
-                return MultiFileLoader.load_text_file(file_path, encoding=encoding)
-            elif ext == '.csv':
-                return MultiFileLoader.load_csv_file(file_path)
-            elif ext == '.json':
-                return MultiFileLoader.load_json_file(file_path)
-            elif ext == '.pdf':
-                return MultiFileLoader.load_pdf_file(file_path, password=password)
-            elif ext == '.docx':
-                return MultiFileLoader.load_docx_file(file_path, mode=mode)
-            elif ext in ['.xlsx', '.xls']:
-                return MultiFileLoader.load_excel_file(file_path, mode=mode)
-            elif ext in ['.md', '.markdown']:
-                return MultiFileLoader.load_markdown_file(file_path, mode=mode)
-            else:
+            loader = _EXT_DISPATCH.get(ext)
+            if loader is None:
                 # 对于未知类型，报错
                 raise ValueError(f"未知文件类型: {ext}")
+            return loader(file_path, encoding, mode, password)
         except Exception as e:
             print(f"加载文件 {file_path} 时出错: {str(e)}")
             return []
@@ -284,6 +358,9 @@ class BlindFileLoader:
         ) -> List[Document]:
         """加载目录中的所有文件.
         
+        可以利用多进程并行加载, 进程数由环境变量FILE_LOAD_THREADS指定, 默认为1.
+        启用多进程时的限制见_map_files.
+        
         Args:
             dir_path (str): 目录路径.
             encoding (str): 文本文件编码.
@@ -293,21 +370,17 @@ class BlindFileLoader:
         Returns:
             List[Document]: 文档列表.
         """
-        files = os.listdir(dir_path)
+        file_paths = _scan_dir(dir_path)
+        loader = partial(
+            BlindFileLoader.load_file,
+            encoding=encoding,
+            mode=mode,
+            password=password
+        )
         docs = []
-        for file in files:
-            file_path = os.path.join(dir_path, file)
-            try:
-                temp = BlindFileLoader.load_file(
-                    file_path,
-                    encoding=encoding,
-                    mode=mode,
-                    password=password
-                )
-                if temp:
-                    docs.append(temp)
-            except Exception as e:
-                print(f"加载文件 {file_path} 时出错: {str(e)}")
+        for temp in _map_files(loader, file_paths, "FILE_LOAD_THREADS"):
+            if temp:
+                docs.append(temp)
         return docs
 
 class SpecificFileLoader:
@@ -326,14 +399,16 @@ class SpecificFileLoader:
         include_img: bool = False,
         img_model: Optional[str] = None,
         img_format: Optional[Literal["text", "markdown-img", "html-img"]] = None,
-        ) -> Optional[List[Document] | PDFMinerLoader]:
+        backend: Literal["pdfminer", "pymupdf", "pypdfium"] = "pymupdf",
+        ) -> Optional[List[Document] | Iterator[Document]]:
         """加载PDF文件.
         
-        利用PDFMinerLoader加载PDF文件.
+        默认利用PyMuPDFLoader加载PDF文件, 其解析部分由C实现, 比纯Python的PDFMiner快得多.
         由于读取图片需要调用ChatOpenAI, 所以读取图片时需要在环境变量中设置OPENAI_API_KEY.
         
         Args:
             file_path (str): 文件路径.
+            mode (Literal["default", "lazy", "async"]): 加载方式.
             from_web (Optional[dict]): 从网页加载PDF文件.
             password (Optional[str]): PDF密码.
             load_mode (Literal["single", "page"]): 加载模式.
@@ -341,10 +416,11 @@ class SpecificFileLoader:
             include_img (bool): 是否包含图片.
             img_model (Optional[str]): 图片模型.
             img_format (Optional[Literal["text", "markdown-img", "html-img"]]): 图片格式.
+            backend (Literal["pdfminer", "pymupdf", "pypdfium"]): 解析后端, 默认为"pymupdf".
         
         Returns:
             List[Document]: 文档列表.
-            PDFMinerLoader: 加载器.
+            Iterator[Document]: 懒加载的文档迭代器.
             None: 加载失败.
         """
         # 检查文件类型是否为PDF
@@ -363,8 +439,18 @@ class SpecificFileLoader:
                 )
             if img_format:
                 kargs["images_inner_format"] = img_format
+        # 选择解析后端
+        match backend:
+            case "pymupdf":
+                loader_cls = PyMuPDFLoader
+            case "pypdfium":
+                loader_cls = PyPDFium2Loader
+            case "pdfminer":
+                loader_cls = PDFMinerLoader
+            case _:
+                raise ValueError(f"无效的解析后端: {backend}")
         # 创建加载器
-        loader = PDFMinerLoader(
+        loader = loader_cls(
             file_path=file_path,
             headers=from_web,
             password=password,
@@ -390,14 +476,18 @@ class SpecificFileLoader:
         single_delimiter: Optional[str] = None,
         img_included: bool = False,
         img_model: Optional[str] = None,
-        img_format: Optional[Literal["text", "markdown-img", "html-img"]] = None
-        ) -> List[Document]:
+        img_format: Optional[Literal["text", "markdown-img", "html-img"]] = None,
+        backend: Literal["pdfminer", "pymupdf", "pypdfium"] = "pymupdf"
+        ) -> Iterator[Document]:
         """加载目录中的所有PDF文件.
         
         利用pdf_load_file加载目录中的所有PDF文件.
         只能是本地文件夹, 只能是未加密文件.
-        会一次性将目录中的所有PDF文件加载到内存中.
+        返回生成器, 不会一次性将目录中的所有PDF文件加载到内存中.
         由于调用了pdf_load_file, 所以读取图片时需要在环境变量中设置OPENAI_API_KEY.
+        进程数由环境变量PDF_LOAD_THREADS指定, 默认为1, 此时逐页懒加载,
+        内存中只保留当前文件的页面.
+        大于1时利用多进程并行解析, 限制见_map_files.
         
         Args:
             path (str): 目录路径.
@@ -406,32 +496,77 @@ class SpecificFileLoader:
             img_included (bool): 是否包含图片.
             img_model (Optional[str]): 图片模型.
             img_format (Optional[Literal["text", "markdown-img", "html-img"]]): 图片格式.
+            backend (Literal["pdfminer", "pymupdf", "pypdfium"]): 解析后端, 默认为"pymupdf".
         
         Returns:
-            List[Document]: 文档列表.
+            Iterator[Document]: 文档生成器.
         """
-        files = os.listdir(path)
-        docs = []
-        for file in files:
-            file_path = os.path.join(path, file)
-            # 检查是否为PDF文件
-            _, ext = os.path.splitext(file.lower())
-            if ext != '.pdf':
-                continue
-            try:
-                temp = SpecificFileLoader.pdf_load_file(
-                    file_path,
-                    load_mode=mode,
-                    single_delimiter=single_delimiter,
-                    include_img=img_included,
-                    img_model=img_model,
-                    img_format=img_format
-                )
-                if temp:
-                    docs.extend(temp)
-            except Exception as e:
-                print(f"加载文件 {file_path} 时出错: {str(e)}")
-        return docs
+        pdf_paths = _scan_dir(path, {".pdf"})
+        loader = partial(
+            SpecificFileLoader.pdf_load_file,
+            load_mode=mode,
+            single_delimiter=single_delimiter,
+            include_img=img_included,
+            img_model=img_model,
+            img_format=img_format,
+            backend=backend
+        )
+        if _load_processes("PDF_LOAD_THREADS") <= 1:
+            for file_path in pdf_paths:
+                try:
+                    yield from loader(file_path, mode="lazy")
+                except Exception as e:
+                    print(f"加载文件 {file_path} 时出错: {str(e)}")
+            return
+        for temp in _map_files(loader, pdf_paths, "PDF_LOAD_THREADS"):
+            if temp:
+                yield from temp
+    
+    @staticmethod
+    def pdf_load_dir_soa(
+        path: str,
+        mode: Literal["single", "page"] = "single",
+        single_delimiter: Optional[str] = None,
+        img_included: bool = False,
+        img_model: Optional[str] = None,
+        img_format: Optional[Literal["text", "markdown-img", "html-img"]] = None,
+        backend: Literal["pdfminer", "pymupdf", "pypdfium"] = "pymupdf"
+        ) -> tuple[List[str], List[dict], List[str]]:
+        """加载目录中的所有PDF文件, 以文本、元数据、ID三个列表的形式返回.
+        
+        利用pdf_load_dir加载, 不保留Document对象, 结果可以直接交给ChromaCollection.add_soa.
+        ID为"文件名:序号", 同一文件重复加载时ID不变.
+        
+        Args:
+            path (str): 目录路径.
+            mode (Literal["single", "page"]): 加载模式.
+            single_delimiter (Optional[str]): 单个文档分页分隔符.
+            img_included (bool): 是否包含图片.
+            img_model (Optional[str]): 图片模型.
+            img_format (Optional[Literal["text", "markdown-img", "html-img"]]): 图片格式.
+            backend (Literal["pdfminer", "pymupdf", "pypdfium"]): 解析后端, 默认为"pymupdf".
+        
+        Returns:
+            tuple[List[str], List[dict], List[str]]: 文本列表, 元数据列表, ID列表.
+        """
+        texts, metadatas, ids = [], [], []
+        counters = {}
+        for doc in SpecificFileLoader.pdf_load_dir(
+            path,
+            mode=mode,
+            single_delimiter=single_delimiter,
+            img_included=img_included,
+            img_model=img_model,
+            img_format=img_format,
+            backend=backend
+        ):
+            file = os.path.basename(doc.metadata.get("source", ""))
+            index = counters.get(file, 0)
+            counters[file] = index + 1
+            texts.append(doc.page_content)
+            metadatas.append(doc.metadata)
+            ids.append(f"{file}:{index}")
+        return texts, metadatas, ids
     
     @staticmethod
     def json_load_file(
@@ -516,6 +651,9 @@ class SpecificFileLoader:
         
         利用json_load_file加载目录中的所有JSON文件.
         会一次性将目录中的所有JSON文件加载到内存中.
+        可以利用多进程并行加载, 进程数由环境变量JSON_LOAD_THREADS指定, 默认为1,
+        启用多进程时的限制见_map_files,
+        此时metadata_func必须可以被pickle, 不能是lambda.
         
         Args:
             path (str): 目录路径.
@@ -529,26 +667,18 @@ class SpecificFileLoader:
         Returns:
             List[Document]: 文档列表.
         """
-        files = os.listdir(path)
+        json_paths = _scan_dir(path, {".json"})
+        loader = partial(
+            SpecificFileLoader.json_load_file,
+            jq_schema=jq_schema,
+            content_key=content_key,
+            content_parsable=content_parsable,
+            text_content=content_string,
+            metadata_func=metadata_func,
+            json_lines=json_lines
+        )
         docs = []
-        for file in files:
-            file_path = os.path.join(path, file)
-            # 检查是否为JSON文件
-            _, ext = os.path.splitext(file.lower())
-            if ext != '.json':
-                continue
-            try:
-                temp = SpecificFileLoader.json_load_file(
-                    file_path,
-                    jq_schema=jq_schema,
-                    content_key=content_key,
-                    content_parsable=content_parsable,
-                    text_content=content_string,
-                    metadata_func=metadata_func,
-                    json_lines=json_lines
-                )
-                if temp:
-                    docs.extend(temp)
-            except Exception as e:
-                print(f"加载文件 {file_path} 时出错: {str(e)}")
+        for temp in _map_files(loader, json_paths, "JSON_LOAD_THREADS"):
+            if temp:
+                docs.extend(temp)
         return docs
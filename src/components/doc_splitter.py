@@ -7,12 +7,281 @@ Copyright 2025 Kai.
 License(GPL)
 Author: Kai
 """
-from typing import Optional, Iterable, Literal, List
+from functools import lru_cache
+from typing import Optional, Iterable, Iterator, Literal, List, Any
+import numpy as np
+import spacy
+from numba import njit
+from spacy.lang.en import English
 from langchain_core.documents import Document
-from langchain_text_splitters import SpacyTextSplitter
+from langchain_text_splitters import SpacyTextSplitter, TextSplitter
+
+# 分割器参数的默认值
+_SPLITTER_DEFAULTS = dict(
+    separator="\n\n",
+    pipeline="en_core_web_sm",
+    max_length=1_000_000,
+    chunk_size=4000,
+    chunk_overlap=200,
+)
+
+# 分句用不到的模型组件, 加载时直接排除
+_UNUSED_COMPONENTS = [
+    "tok2vec",
+    "tagger",
+    "morphologizer",
+    "parser",
+    "senter",
+    "attribute_ruler",
+    "lemmatizer",
+    "ner",
+]
+
+def _load_sentencizer(
+    pipeline: str,
+    max_length: int
+    ) -> Any:
+    """加载只做分句的spacy流水线.
+    
+    只保留分词器, 排除所有统计模型组件, 用基于标点规则的sentencizer分句.
+    "sentencizer"表示使用空白英文流水线.
+    
+    Args:
+        pipeline (str): spacy模型名称.
+        max_length (int): 分割前的文档最大长度.
+    
+    Returns:
+        Language: spacy流水线.
+    """
+    if pipeline == "sentencizer":
+        nlp = English()
+    else:
+        nlp = spacy.load(pipeline, exclude=_UNUSED_COMPONENTS)
+    nlp.add_pipe("sentencizer")
+    nlp.max_length = max_length
+    return nlp
+
+class _SentencizerTextSplitter(SpacyTextSplitter):
+    """只加载分句所需组件的SpacyTextSplitter."""
+    def __init__(
+        self,
+        separator: str = "\n\n",
+        pipeline: str = "en_core_web_sm",
+        max_length: int = 1_000_000,
+        *,
+        strip_whitespace: bool = True,
+        **kwargs: Any
+        ):
+        # 跳过SpacyTextSplitter的初始化, 避免加载完整流水线
+        TextSplitter.__init__(self, **kwargs)
+        self._tokenizer = _load_sentencizer(pipeline, max_length)
+        self._separator = separator
+        self._strip_whitespace = strip_whitespace
+
+@njit(cache=True)
+def _is_terminal(code: int) -> bool:
+    """是否为中文句末标点: 。！？…"""
+    return code == 0x3002 or code == 0xFF01 or code == 0xFF1F or code == 0x2026
+
+@njit(cache=True)
+def _is_closing(code: int) -> bool:
+    """是否为可以跟在句末标点之后的右引号或右括号: ”’」』）》"""
+    return (code == 0x201D or code == 0x2019 or code == 0x300D
+            or code == 0x300F or code == 0xFF09 or code == 0x300B)
+
+@njit(cache=True)
+def _sentence_bounds(codes: np.ndarray) -> np.ndarray:
+    """扫描码位数组, 返回每个句子的(起点, 终点)偏移.
+    
+    在句末标点(连同其后的标点和右引号)或连续换行处断句.
+    """
+    n = codes.shape[0]
+    bounds = np.empty((n + 1, 2), dtype=np.int64)
+    count = 0
+    start = 0
+    i = 0
+    while i < n:
+        code = codes[i]
+        end = -1
+        if _is_terminal(code):
+            end = i + 1
+            while end < n and (_is_terminal(codes[end]) or _is_closing(codes[end])):
+                end += 1
+        elif code == 0x0A and i + 1 < n and codes[i + 1] == 0x0A:
+            end = i + 2
+            while end < n and codes[end] == 0x0A:
+                end += 1
+        if end > 0:
+            bounds[count, 0] = start
+            bounds[count, 1] = end
+            count += 1
+            start = end
+            i = end
+        else:
+            i += 1
+    if start < n:
+        bounds[count, 0] = start
+        bounds[count, 1] = n
+        count += 1
+    return bounds[:count]
+
+@njit(cache=True)
+def _pack_chunks(
+    bounds: np.ndarray,
+    chunk_size: int,
+    chunk_overlap: int
+    ) -> np.ndarray:
+    """将句子贪心合并成块, 返回每个块的(起点, 终点)偏移.
+    
+    相邻块之间重叠不超过chunk_overlap的完整句子;
+    超过chunk_size的单个句子按chunk_size硬切分.
+    """
+    m = bounds.shape[0]
+    if m == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    step = max(chunk_size - chunk_overlap, 1)
+    capacity = m + (bounds[m - 1, 1] - bounds[0, 0]) // step + 1
+    chunks = np.empty((capacity, 2), dtype=np.int64)
+    count = 0
+    i = 0
+    while i < m:
+        start = bounds[i, 0]
+        # 单个句子过长, 硬切分
+        if bounds[i, 1] - start > chunk_size:
+            pos = start
+            while True:
+                end = min(pos + chunk_size, bounds[i, 1])
+                chunks[count, 0] = pos
+                chunks[count, 1] = end
+                count += 1
+                if end >= bounds[i, 1]:
+                    break
+                pos += step
+            i += 1
+            continue
+        # 尽可能多地合并后续句子
+        j = i
+        while j + 1 < m and bounds[j + 1, 1] - start <= chunk_size:
+            j += 1
+        chunks[count, 0] = start
+        chunks[count, 1] = bounds[j, 1]
+        count += 1
+        if j + 1 >= m:
+            break
+        # 回退到重叠部分的起始句子, 但至少前进一句
+        nxt = j + 1
+        while nxt - 1 > i and bounds[j, 1] - bounds[nxt - 1, 0] <= chunk_overlap:
+            nxt -= 1
+        # 保证下一块能放下第j+1句
+        while nxt < j + 1 and bounds[j + 1, 1] - bounds[nxt, 0] > chunk_size:
+            nxt += 1
+        i = nxt
+    return chunks[:count]
+
+class _FastZhTextSplitter(TextSplitter):
+    """基于标点规则的中文分割器, 扫描和合并由numba编译执行."""
+    def split_text(self, text: str) -> List[str]:
+        """分割文本."""
+        codes = np.frombuffer(
+            text.encode("utf-32-le", errors="surrogatepass"),
+            dtype=np.uint32
+        )
+        chunks = _pack_chunks(
+            _sentence_bounds(codes),
+            self._chunk_size,
+            self._chunk_overlap
+        )
+        texts = []
+        for start, end in chunks:
+            chunk = text[start:end]
+            if self._strip_whitespace:
+                chunk = chunk.strip()
+            if chunk:
+                texts.append(chunk)
+        return texts
+
+@lru_cache(maxsize=8)
+def _get_splitter(
+    pipeline: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    separator: str,
+    max_length: int,
+    strip_whitespace: bool
+    ) -> TextSplitter:
+    """获取分割器, 相同参数的分割器只创建一次."""
+    if pipeline == "fast_zh":
+        return _FastZhTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            strip_whitespace=strip_whitespace
+        )
+    return _SentencizerTextSplitter(
+        separator=separator,
+        pipeline=pipeline,
+        max_length=max_length,
+        strip_whitespace=strip_whitespace,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+
+def _split_stream(
+    splitter: TextSplitter,
+    docs: Iterable[Document]
+    ) -> Iterator[Document]:
+    """逐个分割文档, 每次只处理一个文档."""
+    for doc in docs:
+        yield from splitter.split_documents([doc])
 
 class Splitter:
     """文档文本分割组件."""
+    @staticmethod
+    def _coalesce(
+        docs: Iterable[Document],
+        min_length: int = 500
+        ) -> Iterator[Document]:
+        """合并同一来源中相邻的短文档.
+        
+        缓存文档直到总长度达到min_length或来源改变, 再合并为一个文档.
+        只合并元数据中source相同的文档, 没有source的文档原样返回.
+        合并后的元数据取第一个文档的元数据, 若有page则另外记录最后一页end_page.
+        
+        Args:
+            docs (Iterable[Document]): 文档列表.
+            min_length (int): 合并后文档的最小长度, 默认为500.
+        
+        Returns:
+            Iterator[Document]: 合并后的文档生成器.
+        """
+        def merge(buffer: List[Document]) -> Document:
+            if len(buffer) == 1:
+                return buffer[0]
+            metadata = dict(buffer[0].metadata)
+            if "page" in metadata and "page" in buffer[-1].metadata:
+                metadata["end_page"] = buffer[-1].metadata["page"]
+            return Document(
+                page_content="\n\n".join(doc.page_content for doc in buffer),
+                metadata=metadata
+            )
+
+        buffer = []
+        length = 0
+        for doc in docs:
+            source = doc.metadata.get("source")
+            if buffer and source != buffer[0].metadata.get("source"):
+                yield merge(buffer)
+                buffer, length = [], 0
+            if source is None:
+                yield doc
+                continue
+            buffer.append(doc)
+            length += len(doc.page_content)
+            if length >= min_length:
+                yield merge(buffer)
+                buffer, length = [], 0
+        if buffer:
+            yield merge(buffer)
+
     @staticmethod
     def split_docs(
         target: Document | Iterable[Document] | str,
@@ -23,15 +292,19 @@ class Splitter:
         chunk_size: Optional[int] = None,
         chunk_overlap: Optional[int] = None,
         strip_whitespace: bool = True,
-        ) -> List[Document] | List[str]:
+        stream: bool = False,
+        min_length: int = 0,
+        ) -> List[Document] | List[str] | Iterator[Document]:
         """分割文档.
         
         利用spacy分割文档, 文档列表或者文本.
-        根据语义分割, 不支持特殊格式文件的分割, 如json.
+        根据标点规则分句后合并成块, 不支持特殊格式文件的分割, 如json.
+        只加载分词器和sentencizer, 相同参数的分割器会被缓存复用.
         不同语言的分割方式不同, 需要根据语言选择不同的pipeline并下载对应的模型.
         例如:
         en_core_web_sm: 英语
         zh_core_web_sm: 中文
+        fast_zh: 中文, 不使用spacy, 直接按中文句末标点和空行断句, 速度快得多
 
         Args:
             target (Document | Iterable[Document] | str): 需要分割的文档列表或文本.
@@ -42,29 +315,28 @@ class Splitter:
             chunk_size (Optional[int]): 每个块的最大长度, 默认4000.
             chunk_overlap (Optional[int]): 块之间的重叠长度, 默认200.
             strip_whitespace (bool): 是否去除空白字符, 默认为True.
+            stream (bool): "docs"模式下是否返回生成器, 逐个文档分割, 默认为False.
+            min_length (int): "docs"模式下先合并同一来源中相邻的短文档, 直到长度达到min_length,
+                如PDF中只有页眉页脚的页面, 默认为0, 即不合并.
 
         Returns:
             list[Document]: 分割后的文档列表.
             list[str]: 分割后的文本列表.
+            Iterator[Document]: 分割后的文档生成器.
         """
-        kargs = {}
-        if separator:
-            kargs['separator'] = separator
-        if pipeline:
-            kargs['pipeline'] = pipeline
-        if max_length:
-            kargs['max_length'] = max_length
-        if chunk_size:
-            kargs['chunk_size'] = chunk_size
-        if chunk_overlap:
-            kargs['chunk_overlap'] = chunk_overlap
-        splitter = SpacyTextSplitter(
-            strip_whitespace=strip_whitespace,
-            **kargs
-        )
+        # 未指定的参数使用默认值, 保证相同配置得到相同的缓存键
+        params = {**_SPLITTER_DEFAULTS, **{
+            key: value for key, value in locals().items()
+            if key in _SPLITTER_DEFAULTS and value is not None
+        }}
+        splitter = _get_splitter(**params, strip_whitespace=strip_whitespace)
         if mode == "text":
             return splitter.split_text(target)
         elif mode == "doc":
             return splitter.split_documents([target])
         elif mode == "docs":
+            if min_length > 0:
+                target = Splitter._coalesce(target, min_length)
+            if stream:
+                return _split_stream(splitter, target)
             return splitter.split_documents(target)
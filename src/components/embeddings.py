@@ -7,8 +7,21 @@ Copyright 2025 Kai.
 License(GPL)
 Author: Kai
 """ 
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from typing import Literal, Dict, Any
+import torch
 from langchain.embeddings import HuggingFaceEmbeddings
 from huggingface_hub import snapshot_download
+from sentence_transformers import SentenceTransformer
+
+# 推理精度对应的torch数据类型
+_TORCH_DTYPES = {
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
 
 class EmbeddingFromHF:
     """HuggingFace来源的嵌入模型."""
@@ -35,27 +48,131 @@ class EmbeddingFromHF:
             local_dir_use_symlinks=use_symlinks
         )
 
+    @staticmethod
+    def export_onnx(
+        local_dir: str
+        ) -> str:
+        """将模型导出为ONNX格式.
+        
+        导出结果保存在local_dir + "_onnx"目录下, 其中已有onnx/model.onnx时直接复用.
+        先导出到临时目录, 成功后再移动到目标目录, 导出中断不会留下不完整的模型.
+        
+        Args:
+            local_dir (str): 模型本地目录.
+        
+        Returns:
+            str: ONNX模型目录.
+        """
+        onnx_dir = local_dir.rstrip("/\\") + "_onnx"
+        if os.path.isfile(os.path.join(onnx_dir, "onnx", "model.onnx")):
+            return onnx_dir
+        
+        tmp_dir = tempfile.mkdtemp(
+            prefix=os.path.basename(onnx_dir) + ".",
+            dir=os.path.dirname(os.path.abspath(onnx_dir))
+        )
+        try:
+            model = SentenceTransformer(local_dir, device="cpu", backend="onnx")
+            model.save_pretrained(tmp_dir)
+            # 清理之前导出失败留下的目录
+            shutil.rmtree(onnx_dir, ignore_errors=True)
+            os.replace(tmp_dir, onnx_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return onnx_dir
+
+    @staticmethod
+    def _onnx_provider(
+        device: str
+        ) -> Dict[str, Any]:
+        """根据设备选择ONNX Runtime执行后端."""
+        if device.startswith("cuda"):
+            _, _, index = device.partition(":")
+            return {
+                "provider": "CUDAExecutionProvider",
+                "provider_options": {"device_id": int(index or 0)}
+            }
+        return {"provider": "CPUExecutionProvider"}
+
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def _cached(
+        local_dir: str,
+        device: str,
+        normalize_embeddings: bool,
+        onnx: bool,
+        batch_size: int,
+        precision: Literal["fp32", "fp16", "bf16"],
+        compile: bool
+        ) -> HuggingFaceEmbeddings:
+        """创建嵌入模型, 相同参数的模型只加载一次."""
+        model_name = local_dir
+        model_kwargs = {'device': device}
+        if onnx:
+            model_name = EmbeddingFromHF.export_onnx(local_dir)
+            model_kwargs['backend'] = "onnx"
+            model_kwargs['model_kwargs'] = EmbeddingFromHF._onnx_provider(device)
+        elif precision != "fp32":
+            model_kwargs['model_kwargs'] = {'torch_dtype': _TORCH_DTYPES[precision]}
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs=model_kwargs,
+            encode_kwargs={
+                'normalize_embeddings': normalize_embeddings,
+                'batch_size': batch_size
+            }
+        )
+        if compile:
+            # 原地编译底层的transformer模型, encode中的分词和池化保持不变
+            embeddings.client[0].auto_model.compile(dynamic=True)
+        return embeddings
+
     @staticmethod
     def load_model(
         local_dir: str,
         device: str="cpu",
-        normalize_embeddings: bool=False
+        normalize_embeddings: bool=False,
+        onnx: bool=False,
+        precision: Literal["fp32", "fp16", "bf16"]="fp32",
+        compile: bool=False
         ) -> HuggingFaceEmbeddings:
         """加载模型.
         
+        相同参数的模型在进程内只加载一次, 多次调用返回同一个对象, 共享显存中的权重.
+        onnx为True时先将模型导出为ONNX格式, 再用ONNX Runtime推理,
+        需要安装sentence-transformers[onnx-gpu].
+        编码批大小由环境变量EMBEDDING_BATCH_SIZE指定, 默认为64.
+        precision为"bf16"或"fp16"时以低精度加载权重, 建议同时设置normalize_embeddings=True;
+        compile为True时用torch.compile编译模型, 首次编码需要额外的编译时间.
+        precision和compile只适用于PyTorch推理, 不能与onnx同时使用.
+        
         Args:
             local_dir (str): 本地目录.
+            device (str): 运行设备.
+            normalize_embeddings (bool): 是否归一化向量.
+            onnx (bool): 是否使用ONNX Runtime推理.
+            precision (Literal["fp32", "fp16", "bf16"]): 推理精度, 默认为"fp32".
+            compile (bool): 是否使用torch.compile编译模型.
         
         Returns:
             embeddings (HuggingFaceEmbeddings): 嵌入模型.
         """
         if not local_dir:
             raise ValueError("local_dir 不能为空")
+        if precision != "fp32" and precision not in _TORCH_DTYPES:
+            raise ValueError(f"无效的推理精度: {precision}")
+        if onnx and (precision != "fp32" or compile):
+            raise ValueError("onnx 不能与 precision、compile 同时使用")
         
-        embeddings = HuggingFaceEmbeddings(
-            model_name=local_dir,
-            model_kwargs={'device': device},
-            encode_kwargs={'normalize_embeddings': normalize_embeddings}
+        batch_size = int(os.environ.get("EMBEDDING_BATCH_SIZE", 64))
+        return EmbeddingFromHF._cached(
+            local_dir,
+            device,
+            normalize_embeddings,
+            onnx,
+            batch_size,
+            precision,
+            compile
         )
-        return embeddings
 
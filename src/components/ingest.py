@@ -0,0 +1,97 @@
+#!/usr/bin/env python3.10.16
+"""文档入库流程组件.
+
+将PDF加载、文档分割和向量入库组织成异步流水线.
+
+Copyright 2025 Kai.
+License(GPL)
+Author: Kai
+"""
+import asyncio
+from functools import partial
+from typing import Optional, Iterable, List, Dict, Any
+from .doc_loader import SpecificFileLoader, _safe_load
+from .doc_splitter import Splitter
+from .vector_db import ChromaCollection
+
+async def ingest(
+    paths: Iterable[str],
+    collection: ChromaCollection,
+    load_kwargs: Optional[Dict[str, Any]] = None,
+    split_kwargs: Optional[Dict[str, Any]] = None,
+    batch_size: int = 64,
+    queue_size: int = 4,
+    ) -> List[str]:
+    """将PDF文件加载、分割后添加到向量数据库.
+    
+    加载、分割、入库三个阶段并发执行, 阶段之间用有界队列连接,
+    解析下一个PDF文件的同时上一个文件的分块正在计算嵌入.
+    加载和分割在线程中执行, 不阻塞事件循环.
+    
+    Args:
+        paths (Iterable[str]): PDF文件路径.
+        collection (ChromaCollection): 目标向量数据库集合.
+        load_kwargs (Optional[Dict[str, Any]]): 传给SpecificFileLoader.pdf_load_file的参数,
+            不能包含mode.
+        split_kwargs (Optional[Dict[str, Any]]): 传给Splitter.split_docs的参数,
+            不能包含mode和stream.
+        batch_size (int): 每次入库的分块数量, 默认为64.
+        queue_size (int): 阶段之间的队列长度, 默认为4.
+    
+    Returns:
+        List[str]: 实际添加的文档ID列表.
+    """
+    load_kwargs = load_kwargs or {}
+    split_kwargs = split_kwargs or {}
+    # 加载和分割必须一次性返回列表, 才能完全在线程中执行
+    if "mode" in load_kwargs:
+        raise ValueError("load_kwargs 不能包含 mode")
+    if "mode" in split_kwargs or "stream" in split_kwargs:
+        raise ValueError("split_kwargs 不能包含 mode 或 stream")
+    loader = partial(_safe_load, partial(SpecificFileLoader.pdf_load_file, **load_kwargs))
+    loaded = asyncio.Queue(maxsize=queue_size)
+    split = asyncio.Queue(maxsize=queue_size)
+    added_ids = []
+
+    async def load_task():
+        for file_path in paths:
+            docs = await asyncio.to_thread(loader, file_path)
+            if docs:
+                await loaded.put(docs)
+        await loaded.put(None)
+
+    async def split_task():
+        while (docs := await loaded.get()) is not None:
+            chunks = await asyncio.to_thread(
+                Splitter.split_docs, docs, mode="docs", **split_kwargs
+            )
+            await split.put(chunks)
+        await split.put(None)
+
+    async def embed_task():
+        batch = []
+        while (chunks := await split.get()) is not None:
+            batch.extend(chunks)
+            while len(batch) >= batch_size:
+                added_ids.extend(await collection.aadd_documents(
+                    batch[:batch_size], batch_size=batch_size
+                ))
+                batch = batch[batch_size:]
+        if batch:
+            added_ids.extend(await collection.aadd_documents(
+                batch, batch_size=batch_size
+            ))
+
+    tasks = [
+        asyncio.create_task(load_task()),
+        asyncio.create_task(split_task()),
+        asyncio.create_task(embed_task()),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # 任一阶段出错时取消其余阶段, 避免其在队列上永久等待
+        for task in tasks:
+            task.cancel()
+        raise
+    return added_ids
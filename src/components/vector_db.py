@@ -7,10 +7,44 @@ Copyright 2025 Kai.
 License(GPL)
 Author: Kai
 """ 
-from typing import Optional, List, Union
+import asyncio
+import hashlib
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Optional, List, Union, Iterable, Callable
 from langchain.schema.document import Document
+from langchain.retrievers import EnsembleRetriever
 from langchain_chroma import Chroma
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.retrievers import BM25Retriever
+
+# 并行写入Chroma的线程数
+_UPSERT_WORKERS = 4
+
+# HNSW索引默认参数, 适用于bge-m3等归一化的高维向量
+_HNSW_DEFAULTS = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 256,
+    "hnsw:search_ef": 128,
+}
+
+def _content_id(text: str) -> str:
+    """根据文本内容生成文档ID."""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+class _TopKEnsembleRetriever(EnsembleRetriever):
+    """只返回融合后前top_k个文档的EnsembleRetriever."""
+    top_k: int = 4
+
+    def weighted_reciprocal_rank(self,
+        doc_lists: List[List[Document]]
+        ) -> List[Document]:
+        """加权倒数排名融合后截取前top_k个文档."""
+        return super().weighted_reciprocal_rank(doc_lists)[:self.top_k]
 
 class ChromaCollection:
     """Chroma向量数据库集合类.
@@ -19,19 +53,33 @@ class ChromaCollection:
         name (str): 集合名称.
         embedding_model (HuggingFaceEmbeddings): 嵌入模型.
         local_directory (str): 本地目录.
+        index_params (dict): HNSW索引参数.
+        lowercase_query (bool): 查询是否转为小写.
         vector_store (Chroma): 向量数据库.
     """
     def __init__(self,
         collection: str,
         directory: Optional[str]=None,
-        embedding: Optional[HuggingFaceEmbeddings]=None
+        embedding: Optional[HuggingFaceEmbeddings]=None,
+        index_params: Optional[dict]=None,
+        query_cache_size: int=1024,
+        lowercase_query: bool=False
         ):
         """初始化Chroma向量数据库集合.
         
+        HNSW索引参数只在创建集合时生效, 修改已有集合的
+        hnsw:space、hnsw:M或hnsw:construction_ef需要先coll_destroy再重新添加文档.
+        
         Args:
             collection (str): 集合名称.
             embedding (HuggingFaceEmbeddings): 嵌入模型.
             directory (str): 本地目录.
+            index_params (Optional[dict]): HNSW索引参数, 会覆盖默认值,
+                默认为{"hnsw:space": "cosine", "hnsw:M": 32,
+                "hnsw:construction_ef": 256, "hnsw:search_ef": 128}.
+            query_cache_size (int): 缓存的查询向量数量, 默认为1024.
+            lowercase_query (bool): 缓存前是否将查询转为小写, 默认为False.
+                嵌入模型区分大小写, 开启后大小写不同的查询会得到相同的结果.
         """
         if not collection:
             raise ValueError("collection 不能为空")
@@ -39,20 +87,157 @@ class ChromaCollection:
         self.name = collection
         self.embedding_model = embedding
         self.local_directory = directory
+        self.index_params = {**_HNSW_DEFAULTS, **(index_params or {})}
+        self.lowercase_query = lowercase_query
+        self._qcache = lru_cache(maxsize=query_cache_size)(self._embed_query)
         self.coll_create()
         
     def add_documents(self,
-        documents: Union[Document, List[Document]]
-        ):
+        documents: Union[Document, Iterable[Document]],
+        batch_size: int = 64,
+        dedup: bool = True
+        ) -> List[str]:
         """向向量数据库添加文档.
         
+        按batch_size分批计算嵌入, 写入Chroma的操作交给线程池并行执行,
+        计算下一批嵌入时上一批仍在写入.
+        documents可以是生成器, 此时逐批消费, 内存中只保留少量批次.
+        去重时文档ID为文本内容的哈希值, 集合中已存在或重复出现的内容直接跳过,
+        不会重复计算嵌入.
+        
         Args:
-            documents (Union[Document, List[Document]]): 要添加的文档或文档列表
+            documents (Union[Document, Iterable[Document]]): 要添加的文档或文档列表
+            batch_size (int): 每批文档数量, 默认为64
+            dedup (bool): 是否按内容去重, 默认为True, 否则为每个文档生成随机ID
+            
+        Returns:
+            List[str]: 实际添加的文档ID列表
         """
         if isinstance(documents, Document):
             documents = [documents]
+        if batch_size <= 0:
+            raise ValueError("batch_size 必须大于0")
+        if self.embedding_model is None:
+            raise ValueError("未指定嵌入模型, 无法添加文档")
         
-        self.vector_store.add_documents(documents)
+        documents = iter(documents)
+        seen = set()
+        added_ids = []
+        with ThreadPoolExecutor(max_workers=_UPSERT_WORKERS) as executor:
+            futures = deque()
+            while batch := list(islice(documents, batch_size)):
+                texts, metadatas, ids = [], [], []
+                for doc in batch:
+                    if dedup:
+                        doc_id = _content_id(doc.page_content)
+                        if doc_id in seen:
+                            continue
+                        seen.add(doc_id)
+                    else:
+                        doc_id = str(uuid.uuid4())
+                    texts.append(doc.page_content)
+                    metadatas.append(doc.metadata)
+                    ids.append(doc_id)
+                if dedup and ids:
+                    # 跳过集合中已存在的内容
+                    existing = set(self.vector_store.get(ids=ids, include=[])["ids"])
+                    if existing:
+                        keep = [i for i, doc_id in enumerate(ids) if doc_id not in existing]
+                        texts = [texts[i] for i in keep]
+                        metadatas = [metadatas[i] for i in keep]
+                        ids = [ids[i] for i in keep]
+                if not ids:
+                    continue
+                embeddings = self.embedding_model.embed_documents(texts)
+                # 限制未完成的写入数量, 避免待写入的批次堆积在内存中
+                if len(futures) >= 2 * _UPSERT_WORKERS:
+                    futures.popleft().result()
+                futures.append(executor.submit(
+                    self._upsert, ids, texts, metadatas, embeddings
+                ))
+                added_ids.extend(ids)
+            for future in futures:
+                future.result()
+        return added_ids
+    
+    def add_soa(self,
+        texts: List[str],
+        metadatas: List[dict],
+        ids: List[str],
+        embeddings: Optional[List[List[float]]] = None,
+        batch_size: int = 5000
+        ):
+        """以文本、元数据、ID三个平行列表的形式批量写入数据.
+        
+        不经过Document对象, 直接分批upsert到底层集合, ID相同的记录会被覆盖.
+        未提供embeddings时用嵌入模型逐批计算.
+        
+        Args:
+            texts (List[str]): 文本列表
+            metadatas (List[dict]): 元数据列表
+            ids (List[str]): ID列表
+            embeddings (Optional[List[List[float]]]): 预先计算的向量列表
+            batch_size (int): 每批写入数量, 默认为5000, 不能超过Chroma的最大批大小
+        """
+        if not len(texts) == len(metadatas) == len(ids):
+            raise ValueError("texts, metadatas 和 ids 的长度必须相同")
+        if embeddings is not None and len(embeddings) != len(ids):
+            raise ValueError("embeddings 和 ids 的长度必须相同")
+        if batch_size <= 0:
+            raise ValueError("batch_size 必须大于0")
+        if embeddings is None and self.embedding_model is None:
+            raise ValueError("未指定嵌入模型时必须提供 embeddings")
+        
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            if embeddings is not None:
+                batch_embeddings = embeddings[start:end]
+            else:
+                batch_embeddings = self.embedding_model.embed_documents(texts[start:end])
+            self._upsert(
+                ids[start:end],
+                texts[start:end],
+                metadatas[start:end],
+                batch_embeddings
+            )
+    
+    async def aadd_documents(self,
+        documents: Union[Document, Iterable[Document]],
+        batch_size: int = 64,
+        dedup: bool = True
+        ) -> List[str]:
+        """异步向向量数据库添加文档.
+        
+        在线程中执行add_documents, 不阻塞事件循环.
+        
+        Args:
+            documents (Union[Document, Iterable[Document]]): 要添加的文档或文档列表
+            batch_size (int): 每批文档数量, 默认为64
+            dedup (bool): 是否按内容去重, 默认为True
+            
+        Returns:
+            List[str]: 实际添加的文档ID列表
+        """
+        return await asyncio.to_thread(
+            self.add_documents, documents, batch_size, dedup
+        )
+    
+    def _upsert(self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[dict],
+        embeddings: Optional[List[List[float]]] = None
+        ):
+        """直接向底层集合写入一批数据.
+        
+        Chroma不接受空字典作为元数据, 需要替换为None.
+        """
+        self.vector_store._collection.upsert(
+            ids=ids,
+            documents=texts,
+            metadatas=[metadata or None for metadata in metadatas],
+            embeddings=embeddings
+        )
         
     def delete_documents(self,
         ids: Union[str, List[str]]
@@ -84,12 +269,29 @@ class ChromaCollection:
         
         self.vector_store.update_documents(ids, documents)
         
+    def _embed_query(self,
+        query: str
+        ) -> tuple[float, ...]:
+        """计算查询向量, 返回元组以便缓存."""
+        return tuple(self.embedding_model.embed_query(query))
+    
+    def _query_vector(self,
+        query: str
+        ) -> List[float]:
+        """从缓存中获取查询向量."""
+        query = query.strip()
+        if self.lowercase_query:
+            query = query.lower()
+        return list(self._qcache(query))
+    
     def search(self,
         query: str,
         k: int = 4
         ) -> List[Document]:
         """根据查询字符串搜索最相似的文档.
         
+        查询向量会被缓存, 相同的查询只计算一次嵌入.
+        
         Args:
             query (str): 查询字符串
             k (int): 返回的最相似文档数量, 默认为4
@@ -97,7 +299,11 @@ class ChromaCollection:
         Returns:
             List[Document]: 最相似的文档列表
         """
-        return self.vector_store.similarity_search(query, k=k)
+        if self.embedding_model is None:
+            return self.vector_store.similarity_search(query, k=k)
+        return self.vector_store.similarity_search_by_vector(
+            self._query_vector(query), k=k
+        )
     
     def search_with_score(self,
         query: str,
@@ -105,6 +311,8 @@ class ChromaCollection:
         ) -> List[tuple[Document, float]]:
         """根据查询字符串搜索最相似的文档并返回相似度分数.
         
+        查询向量会被缓存, 相同的查询只计算一次嵌入.
+        
         Args:
             query (str): 查询字符串
             k (int): 返回的最相似文档数量,默认为4
@@ -112,7 +320,11 @@ class ChromaCollection:
         Returns:
             List[tuple[Document, float]]: 最相似的文档及其相似度分数的列表
         """
-        return self.vector_store.similarity_search_with_score(query, k=k)
+        if self.embedding_model is None:
+            return self.vector_store.similarity_search_with_score(query, k=k)
+        return self.vector_store.similarity_search_by_vector_with_relevance_scores(
+            self._query_vector(query), k=k
+        )
     
     def search_by_vector(self,
         embedding: List[float],
@@ -129,6 +341,50 @@ class ChromaCollection:
         """
         return self.vector_store.similarity_search_by_vector(embedding, k=k)
  
+    def as_hybrid_retriever(self,
+        k: int = 4,
+        alpha: float = 0.6,
+        preprocess_func: Optional[Callable[[str], List[str]]] = None
+        ) -> EnsembleRetriever:
+        """构建BM25与向量检索混合的检索器.
+        
+        两路检索各取k*4个候选, 用加权倒数排名融合(RRF, c=60)后返回前k个文档.
+        BM25索引由调用时集合中的全部文档构建, 添加文档后需要重新调用.
+        BM25默认按空白分词, 中文文档需要传入preprocess_func, 如list按字切分.
+        
+        Args:
+            k (int): 返回的文档数量, 默认为4
+            alpha (float): 向量检索的权重, BM25的权重为1-alpha, 默认为0.6
+            preprocess_func (Optional[Callable[[str], List[str]]]): BM25分词函数
+            
+        Returns:
+            EnsembleRetriever: 混合检索器
+        """
+        if not 0 <= alpha <= 1:
+            raise ValueError("alpha 必须在0到1之间")
+        
+        data = self.vector_store.get(include=["documents", "metadatas"])
+        if not data["ids"]:
+            raise ValueError("集合为空, 无法构建BM25检索器")
+        kargs = {}
+        if preprocess_func:
+            kargs["preprocess_func"] = preprocess_func
+        bm25_retriever = BM25Retriever.from_texts(
+            data["documents"],
+            metadatas=[metadata or {} for metadata in data["metadatas"]],
+            ids=data["ids"],
+            k=k * 4,
+            **kargs
+        )
+        vector_retriever = self.vector_store.as_retriever(
+            search_kwargs={"k": k * 4}
+        )
+        return _TopKEnsembleRetriever(
+            retrievers=[vector_retriever, bm25_retriever],
+            weights=[alpha, 1 - alpha],
+            top_k=k
+        )
+ 
     def coll_get(self
         ) -> Chroma:
         """获取向量数据库集合."""
@@ -148,7 +404,8 @@ class ChromaCollection:
         self.vector_store = Chroma(
             collection_name=self.name,
             embedding_function=self.embedding_model,
-            persist_directory=self.local_directory
+            persist_directory=self.local_directory,
+            collection_metadata=self.index_params
         )
     
     def coll_clear(self):
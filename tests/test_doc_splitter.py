@@ -0,0 +1,64 @@
+"""文档分割组件测试."""
+import pytest
+from langchain_core.documents import Document
+from src.components.doc_splitter import Splitter
+
+# 包含超过chunk_size的长句, 会触发硬切分
+TEXT = "短句。" + "很长的句子没有标点" * 5 + "。结尾。"
+
+
+@pytest.mark.parametrize("chunk_overlap", [0, 5, 10])
+def test_fast_zh_chunks_within_size(chunk_overlap):
+    chunks = Splitter.split_docs(
+        TEXT,
+        mode="text",
+        pipeline="fast_zh",
+        chunk_size=10,
+        chunk_overlap=chunk_overlap
+    )
+    assert chunks
+    assert all(0 < len(chunk) <= 10 for chunk in chunks)
+    assert chunks[0] == "短句。"
+    assert chunks[-1].endswith("结尾。")
+
+
+def test_fast_zh_no_overlap_covers_text():
+    chunks = Splitter.split_docs(
+        TEXT,
+        mode="text",
+        pipeline="fast_zh",
+        chunk_size=10,
+        chunk_overlap=0
+    )
+    assert "".join(chunks) == TEXT
+
+
+def test_coalesce_merges_same_source_and_keeps_page_range():
+    docs = [
+        Document(page_content="页眉", metadata={"source": "a.pdf", "page": 0}),
+        Document(page_content="页脚", metadata={"source": "a.pdf", "page": 1}),
+        Document(page_content="正文" * 10, metadata={"source": "a.pdf", "page": 2}),
+        Document(page_content="短", metadata={"source": "b.pdf", "page": 0}),
+    ]
+    merged = list(Splitter._coalesce(docs, min_length=10))
+    assert [doc.page_content for doc in merged] == [
+        "页眉\n\n页脚\n\n" + "正文" * 10, "短"
+    ]
+    assert merged[0].metadata == {"source": "a.pdf", "page": 0, "end_page": 2}
+
+
+def test_coalesce_skips_documents_without_source():
+    docs = [
+        Document(page_content="一", metadata={"id": 1}),
+        Document(page_content="二", metadata={"id": 2}),
+    ]
+    assert list(Splitter._coalesce(docs, min_length=10)) == docs
+
+
+def test_split_docs_does_not_coalesce_by_default():
+    docs = [
+        Document(page_content="一。", metadata={"source": "a.pdf", "page": 0}),
+        Document(page_content="二。", metadata={"source": "a.pdf", "page": 1}),
+    ]
+    chunks = Splitter.split_docs(docs, pipeline="fast_zh", chunk_size=10, chunk_overlap=0)
+    assert [chunk.metadata["page"] for chunk in chunks] == [0, 1]